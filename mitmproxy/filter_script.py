@@ -7,6 +7,10 @@ Save as filter_script.py and use with: mitmdump -s filter_script.py
 
 import mitmproxy.http
 from mitmproxy import ctx
+import functools
+import logging
+import queue
+import threading
 import time
 
 # Binary MIME types to filter display for
@@ -16,47 +20,147 @@ BINARY_TYPES = {
     'application/x-', 'font/', 'application/wasm', 'application/msword'
 }
 
+# BINARY_TYPES split for matching: entries ending in '/', '-' or '.' are
+# prefixes (checked with one str.startswith(tuple) call), the rest are exact
+# types (one set lookup)
+_BINARY_PREFIXES = tuple(sorted(bt for bt in BINARY_TYPES if bt.endswith(('/', '-', '.'))))
+_BINARY_EXACT = frozenset(BINARY_TYPES).difference(_BINARY_PREFIXES)
+
+# Whether mitmdump will actually print INFO messages; refreshed from the
+# termlog_verbosity option so we can skip building output nobody sees
+_INFO_ENABLED = True
+
+# Last formatted timestamp as [epoch second, "HH:MM:SS"]
+_TS_CACHE = [0, ""]
+
+# INFO messages waiting for the log writer thread, so flow hooks don't block
+# on terminal/file output; bounded, overflowing messages are dropped
+_LOG_QUEUE = queue.Queue(maxsize=10000)
+_LOG_THREAD = None
+_LOG_DROPPED = 0
+_LOG_FAILED = 0
+
+# How long done() waits for the log writer thread before giving up
+_LOG_FLUSH_TIMEOUT = 5.0
+
+@functools.lru_cache(maxsize=256)
+def is_binary_type(content_type: str) -> bool:
+    """Check a content type against BINARY_TYPES (cached, as few distinct values recur)."""
+    # Drop parameters such as "; charset=utf-8" before comparing
+    mime = content_type.split(';', 1)[0].strip().lower()
+    return mime in _BINARY_EXACT or mime.startswith(_BINARY_PREFIXES)
+
+def current_timestamp() -> str:
+    """Return the current time as HH:MM:SS, formatted at most once per second."""
+    now = int(time.time())
+    if now != _TS_CACHE[0]:
+        _TS_CACHE[0] = now
+        _TS_CACHE[1] = time.strftime("%H:%M:%S", time.localtime(now))
+    return _TS_CACHE[1]
+
+def log_info(message: str) -> None:
+    """Queue an INFO message for the log writer thread."""
+    global _LOG_DROPPED
+    try:
+        _LOG_QUEUE.put_nowait(message)
+    except queue.Full:
+        _LOG_DROPPED += 1
+
+def _drain_log_queue() -> None:
+    """Log writer thread: pass queued messages to ctx.log.info until None arrives."""
+    global _LOG_FAILED
+    while True:
+        message = _LOG_QUEUE.get()
+        if message is None:
+            break
+        # Keep draining if a single message fails, otherwise the queue fills
+        # up and every later message is dropped
+        try:
+            ctx.log.info(message)
+        except Exception:
+            _LOG_FAILED += 1
+
+def load(loader) -> None:
+    """Called when the script is loaded; starts the log writer thread."""
+    global _LOG_THREAD
+    _LOG_THREAD = threading.Thread(target=_drain_log_queue, name="log-writer", daemon=True)
+    _LOG_THREAD.start()
+
+def done() -> None:
+    """Called when the script is unloaded; flushes queued messages."""
+    if _LOG_THREAD is not None:
+        # Bounded waits so a stuck writer can't hang shutdown or script reload
+        try:
+            _LOG_QUEUE.put(None, timeout=_LOG_FLUSH_TIMEOUT)
+        except queue.Full:
+            pass
+        _LOG_THREAD.join(timeout=_LOG_FLUSH_TIMEOUT)
+        if _LOG_THREAD.is_alive():
+            ctx.log.warn("log writer thread did not finish, queued messages may be lost")
+    if _LOG_DROPPED:
+        ctx.log.warn(f"{_LOG_DROPPED} log messages dropped, log queue was full")
+    if _LOG_FAILED:
+        ctx.log.warn(f"{_LOG_FAILED} log messages could not be written")
+
+def configure(updated) -> None:
+    """Called when options change; tracks whether INFO output is visible."""
+    global _INFO_ENABLED
+    if "termlog_verbosity" in updated:
+        # Compare levels, not names: "alert" is INFO + 1 and already hides INFO
+        level = logging.getLevelName(ctx.options.termlog_verbosity.upper())
+        _INFO_ENABLED = level <= logging.INFO
+
 def response(flow: mitmproxy.http.HTTPFlow) -> None:
     """Called when a server response has been received."""
+    if not _INFO_ENABLED:
+        return
     
     # Get content info
     content_type = flow.response.headers.get("content-type", "unknown")
     content_length = flow.response.headers.get("content-length", "unknown")
     
     # Check if it's binary content
-    is_binary = any(content_type.lower().startswith(bt) for bt in BINARY_TYPES)
+    is_binary = is_binary_type(content_type)
     
     # Get timing and size info
     method = flow.request.method
     url = flow.request.pretty_url
     status = flow.response.status_code
-    timestamp = time.strftime("%H:%M:%S", time.localtime())
+    timestamp = current_timestamp()
     
     # Create summary line
     if is_binary:
-        ctx.log.info(f"[{timestamp}] [BINARY] {method} {url}")
-        ctx.log.info(f"    └─ Response: {status} | Type: {content_type} | Size: {content_length}")
+        log_info(f"[{timestamp}] [BINARY] {method} {url}")
+        log_info(f"    └─ Response: {status} | Type: {content_type} | Size: {content_length}")
     else:
-        ctx.log.info(f"[{timestamp}] [TEXT] {method} {url}")
-        ctx.log.info(f"    └─ Response: {status} | Type: {content_type} | Size: {content_length}")
+        log_info(f"[{timestamp}] [TEXT] {method} {url}")
+        log_info(f"    └─ Response: {status} | Type: {content_type} | Size: {content_length}")
         
-        # Show preview of text content if small
-        if hasattr(flow.response, 'text') and len(flow.response.content) < 1000:
+        # Show preview of text content if small. The size comes from the header
+        # or the still-encoded body, so large responses are never decoded here.
+        if content_length.isdigit():
+            body_size = int(content_length)
+        else:
+            body_size = len(flow.response.raw_content or b"")
+        if body_size < 1000:
             preview = (flow.response.text or "")[:100].replace('\n', ' ')
             if preview:
-                ctx.log.info(f"    └─ Preview: {preview}...")
+                log_info(f"    └─ Preview: {preview}...")
 
 def request(flow: mitmproxy.http.HTTPFlow) -> None:
     """Called when a client request has been made."""
+    if not _INFO_ENABLED:
+        return
     
     content_type = flow.request.headers.get("content-type", "")
     content_length = flow.request.headers.get("content-length", "0")
-    timestamp = time.strftime("%H:%M:%S", time.localtime())
+    timestamp = current_timestamp()
     
-    # Log uploads with size > 0
-    if content_type and int(content_length or 0) > 0:
-        is_binary_upload = any(content_type.lower().startswith(bt) for bt in BINARY_TYPES)
+    # Log uploads with size > 0 (string check: no int() parse per request,
+    # and a malformed content-length header can't raise here)
+    if content_type and content_length not in ("", "0", "unknown"):
+        is_binary_upload = is_binary_type(content_type)
         upload_type = "BINARY UPLOAD" if is_binary_upload else "TEXT UPLOAD"
         
-        ctx.log.info(f"[{timestamp}] [{upload_type}] {flow.request.method} {flow.request.pretty_url}")
-        ctx.log.info(f"    └─ Upload Type: {content_type} | Size: {content_length}")
+        log_info(f"[{timestamp}] [{upload_type}] {flow.request.method} {flow.request.pretty_url}")
+        log_info(f"    └─ Upload Type: {content_type} | Size: {content_length}")
@@ -7,8 +7,14 @@ Save as filter_script.py and use with: mitmdump -s filter_script.py
 
 import mitmproxy.http
 from mitmproxy import ctx
+import functools
+import logging
+import queue
+import threading
 import time
 import binascii
+import codecs
+import zlib
 
 # Binary MIME types that should be displayed in hex
 BINARY_TYPES = {
@@ -18,25 +24,85 @@ BINARY_TYPES = {
     'application/vnd.', 'application/x-protobuf', 'multipart/'
 }
 
-def format_hex_dump(data: bytes, max_bytes: int = 512) -> str:
-    """Format binary data as hex dump with ASCII representation."""
+# BINARY_TYPES split for matching: entries ending in '/', '-' or '.' are
+# prefixes (checked with one str.startswith(tuple) call), the rest are exact
+# types (one set lookup)
+_BINARY_PREFIXES = tuple(sorted(bt for bt in BINARY_TYPES if bt.endswith(('/', '-', '.'))))
+_BINARY_EXACT = frozenset(BINARY_TYPES).difference(_BINARY_PREFIXES)
+
+# Whether mitmdump will actually print INFO messages; refreshed from the
+# termlog_verbosity option so we can skip building output nobody sees
+_INFO_ENABLED = True
+
+# Last formatted timestamp as [epoch second, "HH:MM:SS"]
+_TS_CACHE = [0, ""]
+
+# INFO messages waiting for the log writer thread, so flow hooks don't block
+# on terminal/file output; bounded, overflowing messages are dropped
+_LOG_QUEUE = queue.Queue(maxsize=10000)
+_LOG_THREAD = None
+_LOG_DROPPED = 0
+_LOG_FAILED = 0
+
+# How long done() waits for the log writer thread before giving up
+_LOG_FLUSH_TIMEOUT = 5.0
+
+# How much of a body is inspected when guessing whether it is binary
+SNIFF_BYTES = 4096
+
+# Bodies larger than this on the wire are not decoded in full; only their
+# first MAX_INSPECT_BYTES (after content-encoding, where possible) are shown
+MAX_INSPECT_BYTES = 4096
+
+# Compressed input handed to zlib per step when decoding a body prefix; keeps
+# zlib's unconsumed_tail copy bounded instead of proportional to the body
+_DECODE_CHUNK_BYTES = 32 * 1024
+
+# Control bytes that count towards the binary heuristic (everything below 0x20
+# except tab, newline and carriage return)
+_CONTROL_BYTES = bytes(b for b in range(32) if b not in b'\t\n\r')
+
+# Translation table for the hex dump ASCII column: printable bytes map to
+# themselves, everything else to '.'
+_PRINTABLE_TABLE = bytes(b if 32 <= b <= 126 else ord('.') for b in range(256))
+
+def _truncation_note(shown: int, total: int, wire_encoding: str = "") -> str:
+    """Describe how much of a body is shown.
+    
+    wire_encoding is set when the shown bytes were decoded from a gzip/deflate
+    body, whose total is then a wire size rather than a decoded one.
+    """
+    if wire_encoding:
+        return f"... (showing first {shown} decoded bytes; body is {total} bytes {wire_encoding}-encoded on the wire)"
+    return f"... (showing first {shown} bytes of {total} total)"
+
+def format_hex_dump(data: bytes, max_bytes: int = 512, total_size: int | None = None,
+                    wire_encoding: str = "") -> str:
+    """Format binary data as hex dump with ASCII representation.
+    
+    total_size is the size of the whole body when data is only its start;
+    wire_encoding is as for _truncation_note.
+    """
     if not data:
         return "(empty)"
     
     # Limit the amount of data shown
     data_to_show = data[:max_bytes]
-    truncated = len(data) > max_bytes
+    total = len(data) if total_size is None else total_size
+    truncated = bool(wire_encoding) or total > len(data_to_show)
+    
+    # Hex and ASCII columns for the whole dump in one C-level pass each;
+    # every line is then just a slice of these
+    hex_all = binascii.hexlify(data_to_show, ' ').decode('ascii')
+    ascii_all = data_to_show.translate(_PRINTABLE_TABLE).decode('ascii')
     
     lines = []
     for i in range(0, len(data_to_show), 16):
-        chunk = data_to_show[i:i+16]
-        
-        # Hex representation
-        hex_part = ' '.join(f'{b:02x}' for b in chunk)
-        hex_part = hex_part.ljust(47)  # 16 bytes * 2 chars + 15 spaces
+        # Hex representation (3 chars per byte incl. separator)
+        hex_part = hex_all[i*3:i*3+47].ljust(47)  # 16 bytes * 2 chars + 15 spaces
         
         # ASCII representation
-        ascii_part = ''.join(chr(b) if 32 <= b <= 126 else '.' for b in chunk)
+        ascii_part = ascii_all[i:i+16]
         
         # Offset
         offset = f'{i:08x}'
@@ -45,117 +111,274 @@ def format_hex_dump(data: bytes, max_bytes: int = 512) -> str:
     
     result = '\n'.join(lines)
     if truncated:
-        result += f'\n... (showing first {max_bytes} bytes of {len(data)} total)'
+        result += '\n' + _truncation_note(len(data_to_show), total, wire_encoding)
     
     return result
 
-def is_binary_content(content_type: str, data: bytes) -> bool:
-    """Determine if content should be treated as binary."""
-    if any(content_type.lower().startswith(bt) for bt in BINARY_TYPES):
+def _utf8_scan(data: bytes, final: bool = True) -> tuple[bool, int]:
+    """Return whether data is valid UTF-8 and how many control bytes it has.
+    
+    Control bytes never occur inside a multi-byte UTF-8 sequence, so they are
+    counted on the raw bytes; validation is skipped for pure ASCII and
+    otherwise left to CPython's C decoder.
+    """
+    control_chars = len(data) - len(data.translate(None, _CONTROL_BYTES))
+    if data.isascii():
+        return True, control_chars
+    try:
+        codecs.utf_8_decode(data, 'strict', final)
+    except UnicodeDecodeError:
+        return False, control_chars
+    return True, control_chars
+
+@functools.lru_cache(maxsize=256)
+def is_binary_type(content_type: str) -> bool:
+    """Check a content type against BINARY_TYPES (cached, as few distinct values recur)."""
+    # Drop parameters such as "; charset=utf-8" before comparing
+    mime = content_type.split(';', 1)[0].strip().lower()
+    return mime in _BINARY_EXACT or mime.startswith(_BINARY_PREFIXES)
+
+def is_binary_content(content_type: str, data: bytes, truncated: bool = False) -> bool:
+    """Determine if content should be treated as binary.
+    
+    truncated means data is only the start of the body, so it may end in the
+    middle of a multi-byte character.
+    """
+    if is_binary_type(content_type):
         return True
     
-    # Also check if data contains non-printable bytes (heuristic)
-    if data and len(data) > 0:
-        try:
-            # Try to decode as UTF-8, if it fails or contains many control chars, treat as binary
-            decoded = data.decode('utf-8', errors='strict')
-            control_chars = sum(1 for c in decoded if ord(c) < 32 and c not in '\t\n\r')
-            return control_chars > len(decoded) * 0.1  # More than 10% control chars
-        except UnicodeDecodeError:
-            return True
+    # Also check if data contains non-printable bytes (heuristic), looking only
+    # at the start of the body so large responses aren't decoded in full
+    if data:
+        # Fast path: most text bodies (JSON, HTML, JS) start with plain ASCII,
+        # while binary formats tend to have high or control bytes right away
+        head = data[:64]
+        if head.isascii() and len(head.translate(None, _CONTROL_BYTES)) == len(head):
+            return False
+        
+        sample = data[:SNIFF_BYTES]
+        # A multi-byte sequence cut off by the sample boundary is not an error
+        final = not truncated and len(data) <= SNIFF_BYTES
+        valid, control_chars = _utf8_scan(sample, final=final)
+        # Invalid UTF-8 or more than 10% control chars
+        return not valid or control_chars > len(sample) * 0.1
     
     return False
 
-def log_headers(headers: dict, prefix: str) -> None:
-    """Log HTTP headers."""
-    if headers:
-        ctx.log.info(f"    {prefix} Headers:")
-        for name, value in headers.items():
-            ctx.log.info(f"      {name}: {value}")
+def indent_lines(text: str, prefix: str = "      ") -> str:
+    """Prefix every line of text with prefix."""
+    return prefix + text.replace('\n', '\n' + prefix)
+
+def format_headers(headers: mitmproxy.http.Headers, prefix: str) -> str:
+    """Format HTTP headers, including repeated ones, in wire order."""
+    if not headers:
+        return ""
+    lines = [f"    {prefix} Headers:"]
+    # fields holds the raw (name, value) byte pairs, no dict copy needed
+    lines.extend(
+        f"      {name.decode('latin-1')}: {value.decode('latin-1')}"
+        for name, value in headers.fields
+    )
+    return '\n'.join(lines)
 
-def log_data(data: bytes, content_type: str, prefix: str, max_text_bytes: int = 2048) -> None:
-    """Log request/response data, with hex for binary and text for text content."""
+def format_data(data: bytes, content_type: str, prefix: str, max_text_bytes: int = 2048,
+                total_size: int | None = None, size_note: str = "", wire_encoding: str = "") -> str:
+    """Format request/response data, with hex for binary and text for text content.
+    
+    total_size is the size of the whole body when data is only its start;
+    size_note is added to the size line (e.g. the body's content-encoding);
+    wire_encoding is as for _truncation_note.
+    """
     if not data:
-        ctx.log.info(f"    {prefix} Body: (empty)")
-        return
+        return f"    {prefix} Body: (empty)"
     
-    ctx.log.info(f"    {prefix} Body ({len(data)} bytes):")
+    total = len(data) if total_size is None else total_size
+    size = f"{total} bytes, {size_note}" if size_note else f"{total} bytes"
+    lines = [f"    {prefix} Body ({size}):"]
     
-    if is_binary_content(content_type, data):
+    if is_binary_content(content_type, data, truncated=total_size is not None):
         # Binary content - show hex dump
-        hex_dump = format_hex_dump(data)
-        ctx.log.info(f"      [HEX DUMP]")
-        for line in hex_dump.split('\n'):
-            ctx.log.info(f"      {line}")
+        lines.append("      [HEX DUMP]")
+        lines.append(indent_lines(format_hex_dump(data, total_size=total, wire_encoding=wire_encoding)))
     else:
         # Text content - show as text
         try:
             # Limit text display for very large responses
             data_to_show = data[:max_text_bytes]
             text = data_to_show.decode('utf-8', errors='replace')
-            truncated = len(data) > max_text_bytes
+            truncated = bool(wire_encoding) or total > len(data_to_show)
             
-            ctx.log.info(f"      [TEXT CONTENT]")
-            for line in text.split('\n'):
-                ctx.log.info(f"      {line}")
+            lines.append("      [TEXT CONTENT]")
+            lines.append(indent_lines(text))
             
             if truncated:
-                ctx.log.info(f"      ... (showing first {max_text_bytes} bytes of {len(data)} total)")
+                lines.append("      " + _truncation_note(len(data_to_show), total, wire_encoding))
                 
         except Exception as e:
             # Fallback to hex if text decoding fails
-            ctx.log.info(f"      [TEXT DECODE ERROR: {e}, showing as hex]")
-            hex_dump = format_hex_dump(data)
-            for line in hex_dump.split('\n'):
-                ctx.log.info(f"      {line}")
+            lines.append(f"      [TEXT DECODE ERROR: {e}, showing as hex]")
+            lines.append(indent_lines(format_hex_dump(data, total_size=total, wire_encoding=wire_encoding)))
+    
+    return '\n'.join(lines)
+
+def decode_prefix(raw: bytes, encoding: str, max_bytes: int = MAX_INSPECT_BYTES) -> tuple[bytes, bool]:
+    """Return up to max_bytes of decoded body and whether it was decoded.
+    
+    gzip and deflate are decompressed only as far as needed for max_bytes of
+    output, feeding the body to zlib in bounded slices; other encodings are
+    returned raw (still encoded).
+    """
+    encoding = encoding.strip().lower()
+    if encoding in ("", "identity"):
+        return raw[:max_bytes], True
+    if encoding in ("gzip", "deflate"):
+        # 32 + MAX_WBITS detects gzip/zlib headers, -MAX_WBITS is raw deflate
+        view = memoryview(raw)
+        for wbits in (32 + zlib.MAX_WBITS, -zlib.MAX_WBITS):
+            decoder = zlib.decompressobj(wbits)
+            out = bytearray()
+            try:
+                for start in range(0, len(view), _DECODE_CHUNK_BYTES):
+                    out += decoder.decompress(view[start:start + _DECODE_CHUNK_BYTES], max_bytes - len(out))
+                    if len(out) >= max_bytes or decoder.eof:
+                        break
+            except zlib.error:
+                continue
+            return bytes(out), True
+    return raw[:max_bytes], False
+
+def format_body(message: mitmproxy.http.Message, content_type: str, prefix: str) -> str:
+    """Format a request/response body, decoding only the start of large ones."""
+    raw = message.raw_content or b""
+    if len(raw) > MAX_INSPECT_BYTES:
+        encoding = message.headers.get("content-encoding", "")
+        data, decoded = decode_prefix(raw, encoding)
+        wire_encoding = ""
+        if not decoded:
+            size_note = f"still {encoding}-encoded"
+        elif encoding.strip().lower() not in ("", "identity"):
+            size_note = f"{encoding}-encoded on the wire"
+            wire_encoding = encoding
+        else:
+            size_note = ""
+        return format_data(data, content_type, prefix, total_size=len(raw), size_note=size_note,
+                           wire_encoding=wire_encoding)
+    
+    # Decodes content-encoding, so only read it once
+    content = message.content
+    if content:
+        return format_data(content, content_type, prefix)
+    return f"    {prefix} Body: (none)"
+
+def current_timestamp() -> str:
+    """Return the current time as HH:MM:SS, formatted at most once per second."""
+    now = int(time.time())
+    if now != _TS_CACHE[0]:
+        _TS_CACHE[0] = now
+        _TS_CACHE[1] = time.strftime("%H:%M:%S", time.localtime(now))
+    return _TS_CACHE[1]
+
+def log_info(message: str) -> None:
+    """Queue an INFO message for the log writer thread."""
+    global _LOG_DROPPED
+    try:
+        _LOG_QUEUE.put_nowait(message)
+    except queue.Full:
+        _LOG_DROPPED += 1
+
+def _drain_log_queue() -> None:
+    """Log writer thread: pass queued messages to ctx.log.info until None arrives."""
+    global _LOG_FAILED
+    while True:
+        message = _LOG_QUEUE.get()
+        if message is None:
+            break
+        # Keep draining if a single message fails, otherwise the queue fills
+        # up and every later message is dropped
+        try:
+            ctx.log.info(message)
+        except Exception:
+            _LOG_FAILED += 1
+
+def load(loader) -> None:
+    """Called when the script is loaded; starts the log writer thread."""
+    global _LOG_THREAD
+    _LOG_THREAD = threading.Thread(target=_drain_log_queue, name="log-writer", daemon=True)
+    _LOG_THREAD.start()
+
+def done() -> None:
+    """Called when the script is unloaded; flushes queued messages."""
+    if _LOG_THREAD is not None:
+        # Bounded waits so a stuck writer can't hang shutdown or script reload
+        try:
+            _LOG_QUEUE.put(None, timeout=_LOG_FLUSH_TIMEOUT)
+        except queue.Full:
+            pass
+        _LOG_THREAD.join(timeout=_LOG_FLUSH_TIMEOUT)
+        if _LOG_THREAD.is_alive():
+            ctx.log.warn("log writer thread did not finish, queued messages may be lost")
+    if _LOG_DROPPED:
+        ctx.log.warn(f"{_LOG_DROPPED} log messages dropped, log queue was full")
+    if _LOG_FAILED:
+        ctx.log.warn(f"{_LOG_FAILED} log messages could not be written")
+
+def configure(updated) -> None:
+    """Called when options change; tracks whether INFO output is visible."""
+    global _INFO_ENABLED
+    if "termlog_verbosity" in updated:
+        # Compare levels, not names: "alert" is INFO + 1 and already hides INFO
+        level = logging.getLevelName(ctx.options.termlog_verbosity.upper())
+        _INFO_ENABLED = level <= logging.INFO
 
 def request(flow: mitmproxy.http.HTTPFlow) -> None:
     """Called when a client request has been made."""
+    if not _INFO_ENABLED:
+        return
     
-    timestamp = time.strftime("%H:%M:%S", time.localtime())
+    timestamp = current_timestamp()
     method = flow.request.method
     url = flow.request.pretty_url
     content_type = flow.request.headers.get("content-type", "")
-    content_length = len(flow.request.content) if flow.request.content else 0
+    content_length = len(flow.request.raw_content or b"")
     
-    ctx.log.info(f"\n{'='*80}")
-    ctx.log.info(f"[{timestamp}] REQUEST: {method} {url}")
-    ctx.log.info(f"    Content-Type: {content_type or 'none'}")
-    ctx.log.info(f"    Content-Length: {content_length}")
-    
-    # Log request headers
-    log_headers(dict(flow.request.headers), "Request")
+    # One log call for the summary and headers, one for the body
+    header_block = (
+        f"\n{'='*80}\n"
+        f"[{timestamp}] REQUEST: {method} {url}\n"
+        f"    Content-Type: {content_type or 'none'}\n"
+        f"    Content-Length: {content_length}"
+    )
+    headers = format_headers(flow.request.headers, "Request")
+    if headers:
+        header_block += f"\n{headers}"
+    log_info(header_block)
     
-    # Log request body if present
-    if flow.request.content:
-        log_data(flow.request.content, content_type, "Request")
-    else:
-        ctx.log.info(f"    Request Body: (none)")
+    log_info(format_body(flow.request, content_type, "Request"))
 
 def response(flow: mitmproxy.http.HTTPFlow) -> None:
     """Called when a server response has been received."""
+    if not _INFO_ENABLED:
+        return
     
-    timestamp = time.strftime("%H:%M:%S", time.localtime())
+    timestamp = current_timestamp()
     status = flow.response.status_code
     content_type = flow.response.headers.get("content-type", "")
-    content_length = len(flow.response.content) if flow.response.content else 0
-    
-    ctx.log.info(f"[{timestamp}] RESPONSE: {status} {flow.response.reason}")
-    ctx.log.info(f"    Content-Type: {content_type or 'none'}")
-    ctx.log.info(f"    Content-Length: {content_length}")
-    
-    # Log response headers
-    log_headers(dict(flow.response.headers), "Response")
+    content_length = len(flow.response.raw_content or b"")
     
-    # Log response body if present
-    if flow.response.content:
-        log_data(flow.response.content, content_type, "Response")
-    else:
-        ctx.log.info(f"    Response Body: (none)")
+    # One log call for the summary and headers, one for the body
+    header_block = (
+        f"[{timestamp}] RESPONSE: {status} {flow.response.reason}\n"
+        f"    Content-Type: {content_type or 'none'}\n"
+        f"    Content-Length: {content_length}"
+    )
+    headers = format_headers(flow.response.headers, "Response")
+    if headers:
+        header_block += f"\n{headers}"
+    log_info(header_block)
     
-    ctx.log.info(f"{'='*80}")
+    log_info(f"{format_body(flow.response, content_type, 'Response')}\n{'='*80}")
 
 def error(flow: mitmproxy.http.HTTPFlow) -> None:
     """Called when an error occurs."""
-    timestamp = time.strftime("%H:%M:%S", time.localtime())
+    timestamp = current_timestamp()
     ctx.log.error(f"[{timestamp}] ERROR: {flow.error}")